@@ -6,23 +6,32 @@ Writes to: docs/lbc.ics
 """
 from __future__ import annotations
 
+import functools
 import hashlib
+import json
 import re
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
 from typing import Iterable, Optional
 from zoneinfo import ZoneInfo
 
 import requests
-from bs4 import BeautifulSoup
-from dateutil import parser as dtparser
-from icalendar import Calendar, Event
+from lxml import etree
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 
 TZ = ZoneInfo("Europe/London")
 BASE = "https://www.londonbuddhistcentre.com"
 OUTFILE = Path("docs/lbc.ics")
 
+# ETag/Last-Modified per page plus the last body seen, so unchanged pages come back as 304
+CACHE_DIR = Path(".cache/http")
+VALIDATORS_FILE = CACHE_DIR / "validators.json"
+
 # These are the category pages you asked for
 CATEGORY_PAGES = [
     f"{BASE}/whats-on?tags-event=Meditation",
@@ -37,14 +46,115 @@ HEADERS = {
     "User-Agent": "Mozilla/5.0 (compatible; LBC-ICS/1.0; +https://github.com/axelwild2/lbc-calendar-feed)"
 }
 
-def stable_uid(text: str) -> str:
-    h = hashlib.sha256(text.encode("utf-8")).hexdigest()[:24]
-    return f"{h}@lbc-ics"
+# One pooled, keep-alive session shared by every page fetch
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+_adapter = HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=8,
+    max_retries=Retry(total=3, backoff_factor=0.3),
+)
+SESSION.mount("https://", _adapter)
+SESSION.mount("http://", _adapter)
+
+# Date + time line in one pass, e.g. "2 Jan | 8:00 am - 9:00 am" (sometimes with en dash)
+_CARD_RE = re.compile(
+    r"\b(\d{1,2})\s+(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\b"
+    r".{0,40}?"
+    r"(\d{1,2}:\d{2}\s*(?i:am|pm))\s*[-–]\s*(\d{1,2}:\d{2}\s*(?i:am|pm))"
+)
+
+def _has_class(name: str) -> str:
+    """XPath predicate matching one token of a multi-valued class attribute."""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+# Card selectors, compiled once (CSS equivalents in the comments)
+_CARD_CLASSES = frozenset({"w-layout-grid", "whatson-events"})  # div.w-layout-grid.whatson-events
+_LINK_XP = etree.XPath('(.//a[@fs-list-element="item-link"])[1]')  # a[fs-list-element="item-link"]
+_TITLE_XP = etree.XPath('(.//h4[@fs-list-field="keyword"])[1]')  # h4[fs-list-field="keyword"]
+_DESC_XP = etree.XPath(f"(.//*[{_has_class('whats-on-content')}]//*[{_has_class('text-size-small')}])[1]")  # .whats-on-content .text-size-small
+_DATE_TIME_XP = etree.XPath(f".//*[{_has_class('event-date')} or {_has_class('event-time')}] | .//time")  # .event-date, .event-time, time
+_TEXT_XP = etree.XPath(".//text()")
+_WS_RE = re.compile(r"\s+")
+
+def stable_uid(url: str, start: datetime) -> str:
+    h = hashlib.blake2b(digest_size=12)  # 24 hex chars
+    h.update(url.encode("utf-8"))
+    h.update(b"|")
+    h.update(struct.pack("!q", int(start.timestamp())))
+    return f"{h.hexdigest()}@lbc-ics"
+
+@dataclass(slots=True)
+class EventCard:
+    """One timed event pulled from a "whatson-events" card."""
+
+    title: str
+    start: datetime
+    end: datetime
+    url: str
+    desc: str
+
+def load_validators() -> dict[str, dict]:
+    try:
+        return json.loads(VALIDATORS_FILE.read_text())
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def save_validators(validators: dict[str, dict]) -> None:
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    VALIDATORS_FILE.write_text(json.dumps(validators, indent=2, sort_keys=True))
+    # Drop bodies no page points at any more
+    keep = {f"{v['body_sha']}.html" for v in validators.values()}
+    for f in CACHE_DIR.glob("*.html"):
+        if f.name not in keep:
+            f.unlink()
+
+def fetch_cards(url: str, validators: dict[str, dict]) -> list[EventCard]:
+    """
+    Download a page and parse its event cards while the body is still arriving.
 
-def fetch(url: str) -> str:
-    r = requests.get(url, headers=HEADERS, timeout=30)
-    r.raise_for_status()
-    return r.text
+    Sends the page's stored ETag/Last-Modified; on 304 the cached body is parsed instead.
+    validators[url] is updated in place when the server sends new ones.
+    """
+    cached = validators.get(url)
+    body_file = CACHE_DIR / f"{cached['body_sha']}.html" if cached else None
+    headers = {}
+    if body_file and body_file.exists():
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    chunks: list[bytes] = []
+
+    def tee(r: requests.Response) -> Iterable[bytes]:
+        for chunk in r.iter_content(65536):
+            chunks.append(chunk)
+            yield chunk
+
+    with SESSION.get(url, headers=headers, timeout=30, stream=True) as r:
+        if r.status_code == 304 and headers:
+            return list(iter_event_cards([body_file.read_bytes()], cached.get("encoding")))
+        r.raise_for_status()
+        # Honour a charset from the Content-Type header; otherwise let lxml sniff <meta charset>
+        encoding = r.encoding if "charset=" in r.headers.get("Content-Type", "").lower() else None
+        cards = list(iter_event_cards(tee(r), encoding))
+        etag = r.headers.get("ETag")
+        last_modified = r.headers.get("Last-Modified")
+
+    validators.pop(url, None)
+    if etag or last_modified:
+        body = b"".join(chunks)
+        body_sha = hashlib.sha256(body).hexdigest()
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        (CACHE_DIR / f"{body_sha}.html").write_bytes(body)
+        validators[url] = {
+            "etag": etag,
+            "last_modified": last_modified,
+            "body_sha": body_sha,
+            "encoding": encoding,
+        }
+    return cards
 
 def absolute_url(href: str) -> str:
     if href.startswith("http://") or href.startswith("https://"):
@@ -53,125 +163,200 @@ def absolute_url(href: str) -> str:
         return BASE + href
     return BASE + "/" + href
 
-def parse_time_range(times_text: str) -> tuple[Optional[str], Optional[str]]:
+@functools.lru_cache(maxsize=4096)
+def _parse_dt(day: int, mon: str, year: int, t: str) -> datetime:
     """
-    Expect strings like: "8:00 am - 9:00 am" (sometimes with en dash).
-    Returns (start_str, end_str) or (None, None)
+    Build a London datetime from card parts, e.g. (2, "Jan", 2026, "8:00 am").
+    Recurring classes repeat the same parts across pages, so results are cached.
     """
-    t = times_text.strip().replace("–", "-")
-    # common pattern: "8:00 am - 9:00 am"
-    m = re.search(r"(\d{1,2}:\d{2}\s*(?:am|pm))\s*-\s*(\d{1,2}:\d{2}\s*(?:am|pm))", t, re.I)
-    if not m:
-        return None, None
-    return m.group(1), m.group(2)
+    t = "".join(t.split())  # "8:00 am" / "8:00am" -> "8:00am"
+    return datetime.strptime(f"{day} {mon} {year} {t}", "%d %b %Y %I:%M%p").replace(tzinfo=TZ)
 
-def iter_event_cards(html: str) -> Iterable[dict]:
+def node_text(node) -> str:
+    """All text under node with whitespace runs collapsed to single spaces."""
+    return _WS_RE.sub(" ", " ".join(_TEXT_XP(node))).strip()
+
+def iter_event_cards(chunks: Iterable[bytes], encoding: Optional[str] = None) -> Iterable[EventCard]:
     """
-    Pull events from the server-rendered HTML.
+    Pull events from the server-rendered HTML, fed in as raw byte chunks.
 
     We look for each "whatson-events" card that contains:
     - an internal page link: a[fs-list-element="item-link"]
     - a title: h4[fs-list-field="keyword"]
     - date/time text inside the card
-    """
-    soup = BeautifulSoup(html, "html.parser")
-
-    for card in soup.select("div.w-layout-grid.whatson-events"):
-        link_tag = card.select_one('a[fs-list-element="item-link"]')
-        title_tag = card.select_one('h4[fs-list-field="keyword"]')
-        if not link_tag or not title_tag:
-            continue
-
-        href = link_tag.get("href", "").strip()
-        if not href:
-            continue
-        url = absolute_url(href)
-
-        title = " ".join(title_tag.get_text(" ", strip=True).split())
-
-        # Find the visible date + time line, e.g. "2 Jan | 8:00 am - 9:00 am"
-        # The markup typically has "2 Jan" then "|" then times.
-        text = " ".join(card.get_text(" ", strip=True).split())
-
-        # Try to detect a day+month like "2 Jan" or "20 Dec"
-        dm = re.search(r"\b(\d{1,2})\s+(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\b", text)
-        if not dm:
-            continue
-
-        day = int(dm.group(1))
-        mon = dm.group(2)
-        # If the page contains items spanning years, they include data-end-time on parent w-dyn-item.
-        # Grab it if present; it’s the most reliable for year.
-        parent_dyn = card.find_parent("div", class_="w-dyn-item")
-        year = None
-        if parent_dyn and parent_dyn.has_attr("data-end-time"):
-            try:
-                end_dt = dtparser.parse(parent_dyn["data-end-time"])
-                year = end_dt.year
-            except Exception:
-                year = None
-        if year is None:
-            # fallback: assume current year (London time)
-            year = datetime.now(TZ).year
-
-        start_str, end_str = parse_time_range(text)
-        if not start_str or not end_str:
-            # If no time range, skip (multi-day blocks on the page can confuse parsing)
-            continue
-
-        # Build datetimes
-        date_str = f"{day} {mon} {year}"
-        dt_start = dtparser.parse(f"{date_str} {start_str}", dayfirst=True).replace(tzinfo=TZ)
-        dt_end = dtparser.parse(f"{date_str} {end_str}", dayfirst=True).replace(tzinfo=TZ)
-
-        # Description: first “text-size-small” paragraph inside the card is usually the blurb
-        desc_tag = card.select_one(".whats-on-content .text-size-small")
-        desc = desc_tag.get_text(" ", strip=True) if desc_tag else ""
-
-        yield {
-            "title": title,
-            "start": dt_start,
-            "end": dt_end,
-            "url": url,
-            "desc": desc,
-        }
-
-def build_calendar() -> Calendar:
-    cal = Calendar()
-    cal.add("prodid", "-//London Buddhist Centre//Auto ICS//EN")
-    cal.add("version", "2.0")
-    cal.add("x-wr-calname", "London Buddhist Centre")
-    cal.add("x-wr-timezone", "Europe/London")
 
+    Each card is handled as soon as its closing tag has been parsed and then cleared,
+    so the whole page never has to be held as a tree.
+    """
+    parser = etree.HTMLPullParser(events=("start", "end"), tag="div", encoding=encoding)
+    # fallback: assume current year (London time)
+    this_year = datetime.now(TZ).year
+    # Year of each open w-dyn-item, innermost last. If the page contains items spanning
+    # years, they include data-end-time on the parent w-dyn-item; it’s the most reliable for year.
+    dyn_years: list[tuple[etree._Element, Optional[int]]] = []
+
+    def drain() -> Iterable[EventCard]:
+        for event, el in parser.read_events():
+            classes = el.get("class", "").split()
+            if event == "start":
+                if "w-dyn-item" in classes:
+                    dyn_years.append((el, end_time_year(el.get("data-end-time"))))
+                continue
+            if dyn_years and dyn_years[-1][0] is el:
+                dyn_years.pop()
+            if _CARD_CLASSES.issubset(classes):
+                year = dyn_years[-1][1] if dyn_years else None
+                item = parse_card(el, year or this_year)
+                el.clear(keep_tail=True)
+                if item is not None:
+                    yield item
+
+    for chunk in chunks:
+        parser.feed(chunk)
+        yield from drain()
+    parser.close()
+    yield from drain()
+
+def end_time_year(end_time: Optional[str]) -> Optional[int]:
+    """Year of a w-dyn-item data-end-time, e.g. "2026-01-03T16:00:00.000Z" -> 2026."""
+    if end_time is None:
+        return None
+    try:
+        return datetime.fromisoformat(end_time.replace("Z", "+00:00")).year
+    except ValueError:
+        # Not strict ISO 8601, but the timestamp still starts with the year
+        return int(end_time[:4]) if end_time[:4].isdigit() else None
+
+def parse_card(card, year: int) -> Optional[EventCard]:
+    """
+    Extract one event from a "whatson-events" card element, or None if it isn't a timed event.
+    """
+    link_tag = _LINK_XP(card)
+    title_tag = _TITLE_XP(card)
+    if not link_tag or not title_tag:
+        return None
+    link_tag, title_tag = link_tag[0], title_tag[0]
+
+    href = link_tag.get("href", "").strip()
+    if not href:
+        return None
+    url = absolute_url(href)
+
+    title = node_text(title_tag)
+
+    # Find the visible date + time line, e.g. "2 Jan | 8:00 am - 9:00 am"
+    # The markup typically has "2 Jan" then "|" then times. Look in the dedicated
+    # date/time nodes first and only walk the whole card if they miss.
+    m = None
+    dt_nodes = _DATE_TIME_XP(card)
+    if dt_nodes:
+        m = _CARD_RE.search(" ".join(node_text(n) for n in dt_nodes))
+    if not m:
+        m = _CARD_RE.search(node_text(card))
+    if not m:
+        # No date followed by a time range: skip (multi-day blocks on the page can confuse parsing)
+        return None
+
+    day = int(m.group(1))
+    mon = m.group(2)
+    start_str, end_str = m.group(3), m.group(4)
+
+    dt_start = _parse_dt(day, mon, year, start_str)
+    dt_end = _parse_dt(day, mon, year, end_str)
+
+    # Description: first “text-size-small” paragraph inside the card is usually the blurb
+    desc_tag = _DESC_XP(card)
+    desc = node_text(desc_tag[0]) if desc_tag else ""
+
+    return EventCard(title, dt_start, dt_end, url, desc)
+
+def ics_escape(text: str) -> str:
+    """Escape a TEXT value per RFC 5545 §3.3.11 (newlines become a literal \\n)."""
+    return (
+        text.replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\r\n", "\\n")
+        .replace("\n", "\\n")
+        .replace("\r", "\\n")
+    )
+
+def fold_line(line: str) -> str:
+    """
+    Fold a content line to at most 75 octets per physical line (RFC 5545 §3.1),
+    without splitting a backslash escape across the break.
+    """
+    if len(line.encode("utf-8")) <= 75:
+        return line
+    parts: list[str] = []
+    current: list[str] = []
+    size = 0
+    limit = 75
+    for ch in line:
+        n = len(ch.encode("utf-8"))
+        if current and size + n > limit:
+            carry = current.pop() if current[-1] == "\\" and len(current) > 1 else None
+            parts.append("".join(current))
+            current, size = ([carry], 1) if carry else ([], 0)
+            limit = 74  # continuation lines start with a space
+        current.append(ch)
+        size += n
+    parts.append("".join(current))
+    return "\r\n ".join(parts)
+
+def vevent(item: EventCard, uid: str) -> bytes:
+    """Render one event as a VEVENT block."""
+    tzid = TZ.key
+    lines = [
+        "BEGIN:VEVENT",
+        f"SUMMARY:{ics_escape(item.title)}",
+        f"DTSTART;TZID={tzid}:{item.start:%Y%m%dT%H%M%S}",
+        f"DTEND;TZID={tzid}:{item.end:%Y%m%dT%H%M%S}",
+        f"UID:{uid}",
+    ]
+    if item.desc:
+        lines.append(f"DESCRIPTION:{ics_escape(item.desc)}")
+    lines.append(f"URL:{item.url}")
+    lines.append("END:VEVENT")
+    return "".join(fold_line(line) + "\r\n" for line in lines).encode("utf-8")
+
+CALENDAR_HEADER = (
+    b"BEGIN:VCALENDAR\r\n"
+    b"VERSION:2.0\r\n"
+    b"PRODID:-//London Buddhist Centre//Auto ICS//EN\r\n"
+    b"X-WR-CALNAME:London Buddhist Centre\r\n"
+    b"X-WR-TIMEZONE:Europe/London\r\n"
+)
+
+def build_calendar() -> bytes:
     seen = set()
-
-    for page in CATEGORY_PAGES:
-        html = fetch(page)
-        for item in iter_event_cards(html):
-            key = (item["title"], item["start"].isoformat(), item["url"])
-            if key in seen:
+    events: list[bytes] = []
+
+    # Fetch all pages concurrently; map() keeps CATEGORY_PAGES order so output is stable.
+    # Each worker only touches its own page's entry in validators.
+    validators = load_validators()
+    with ThreadPoolExecutor(max_workers=len(CATEGORY_PAGES)) as ex:
+        pages = list(ex.map(lambda page: fetch_cards(page, validators), CATEGORY_PAGES))
+    save_validators(validators)
+
+    for items in pages:
+        for item in items:
+            # The same event is listed under several categories; url + start identifies it
+            uid = stable_uid(item.url, item.start)
+            if uid in seen:
                 continue
-            seen.add(key)
-
-            ev = Event()
-            ev.add("uid", stable_uid(item["url"] + "|" + item["start"].isoformat()))
-            ev.add("summary", item["title"])
-            ev.add("dtstart", item["start"])
-            ev.add("dtend", item["end"])
-            ev.add("url", item["url"])
-            if item["desc"]:
-                ev.add("description", item["desc"])
+            seen.add(uid)
 
-            cal.add_component(ev)
+            events.append(vevent(item, uid))
 
-    return cal
+    return CALENDAR_HEADER + b"".join(events) + b"END:VCALENDAR\r\n"
 
 def main() -> None:
     OUTFILE.parent.mkdir(parents=True, exist_ok=True)
-    cal = build_calendar()
+    ics = build_calendar()
 
     # If we somehow found zero events, still write the file (but this is your warning signal)
-    OUTFILE.write_bytes(cal.to_ical())
+    OUTFILE.write_bytes(ics)
 
     print(f"Wrote: {OUTFILE} ({OUTFILE.stat().st_size} bytes)")
 